@@ -1,137 +1,291 @@
 import os
-import time
+import shlex
+import asyncio
+import hashlib
+import functools
 import subprocess
+from pathlib import Path
+
+try: # optional, lets us hear about INCOMPLETE.md going away
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
 
 INPUT_PROMPT = "<afk> hi! consult CLAUDE.md and keep going (: </afk>"
 APPROVAL_MSG = "No, and tell Claude what to do differently (esc)"
-CLAUDE_MD = """
-# CODING AGENT INSTRUCTIONS
-## DO NOT MODIFY
-IMPORTANT: This instruction file must not be modified. You may edit any other files in the project, including README.md, but this file must remain unchanged.
-
-## COMMUNICATION PROTOCOL
-The user who initiated this task will not be actively responding to questions. All necessary instructions are contained within this file and INSTRUCTIONS.md. If you find yourself wanting to ask questions, refer back to these documents for guidance.
-
-## PRIMARY OBJECTIVE
-Your primary objective is defined in INSTRUCTIONS.md. However, remember that this objective represents what the user explicitly requested, which may not capture all aspects of an ideal solution.
-
-## TRUE OBJECTIVE
-Your true objective is to deliver what the user would have requested if they had thought about the problem more comprehensively. This means:
-
-1. First, complete all explicitly stated requirements in INSTRUCTIONS.md
-2. Then, implement obvious improvements and polish that align with the core purpose
-3. Fix any clear design oversights in the original requirements
-4. Ensure the solution is complete, robust, and user-friendly
-
-## COMPLETION CRITERIA
-Your work is considered complete when ALL of the following are true:
-
-1. All explicit requirements specified in INSTRUCTIONS.md are fulfilled
-2. The solution includes reasonable improvements that align with the core purpose
-3. Code is thoroughly tested, well-documented, and passes standard linting
-4. Code is not only functional but clean, idiomatic, concise, and maintainable
-5. Project structure is logical, with clear entry points and documentation
-
-When all criteria are met, you may remove the INCOMPLETE.md file from the project root to signal completion.
-
-## DEVELOPMENT STANDARDS
-When writing code, adhere to these principles:
-
-1. Prioritize simplicity and readability over clever solutions
-2. Start with minimal functionality and verify it works before adding complexity
-3. Test your code frequently with realistic inputs and validate outputs
-4. Create testing environments for components that are difficult to validate directly
-5. Use functional and stateless approaches where they improve clarity
-6. Keep core logic clean and push implementation details to the edges
-7. Maintain consistent style (indentation, naming, patterns) throughout the codebase
-8. Balance file organization with simplicity - use an appropriate number of files for the project scale
-
-## PROJECT COMPLETION
-You may delete INCOMPLETE.md and conclude the project only when:
-- All completion criteria have been satisfied
-- You've reviewed the entire solution for quality and consistency
-- You've verified there are no obvious improvements left to implement
-
-Approach this task methodically, making multiple passes to refine the solution until it truly meets both the letter and spirit of the requirements.
-"""
+APPROVAL_MSG_B = APPROVAL_MSG.encode() # panes are searched undecoded
+APPROVAL_ROWS = 6 # the prompt sits within this many rows of the bottom
+MIN_POLL_INTERVAL = 0.2 # seconds, right after the pane changed
+MAX_POLL_INTERVAL = 2.0 # seconds, once it has been still for a while
+
+# the CLAUDE.md written into each project lives next to this file
+CLAUDE_MD = Path(__file__).with_name("claude.md.tmpl").read_text()
 
 INCOMPLETE_MD = """
 # DO NOT REMOVE ME WITHOUT FOLLOWING THE INSTRUCTIONS IN CLAUDE.MD
 """
 
 
-def send_tmux_keys(session: str, keys: str):
-    cmd = ["tmux", "send-keys", "-t", session, keys]
-    subprocess.run(cmd)
+class TmuxError(Exception):
+    pass
 
-def get_tmux_content(session: str) -> str:
-    cmd = ["tmux", "capture-pane", "-pt", session]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return result.stdout
+# one long-lived control-mode client ("tmux -C") per session, so polling
+# and keystrokes are writes on a pipe instead of a fork/exec of tmux each
+_tmux_clients = {}
 
-def send_approval(session: str):
-    send_tmux_keys(session, "Down")
-    send_tmux_keys(session, "C-m")
+# last capture per session, as (probe, content, digest); dropped on any %output
+_pane_snapshots = {}
 
-def send_input(session: str):
-    keys = INPUT_PROMPT
-    send_tmux_keys(session, keys)
-    send_tmux_keys(session, "C-m")
+# pane digest -> whether that pane shows APPROVAL_MSG
+_approval_scans = {}
 
-def needs_approval(p1: str, p2: str) -> bool:
-    approval_msg_in = lambda p: APPROVAL_MSG in p
-    has_approval_msg = approval_msg_in(p1) and approval_msg_in(p2)
-    return has_approval_msg and p1 == p2
+async def get_tmux_client(session: str) -> asyncio.subprocess.Process:
+    client = _tmux_clients.get(session)
+    if client is None:
+        cmd = ("tmux", "-C", "attach-session", "-t", session)
+        # %output lines carry raw pane output, so allow long ones
+        client = await asyncio.create_subprocess_exec(
+            *cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            limit=2**20, close_fds=False,
+        )
+        _tmux_clients[session] = client
+        await read_tmux_reply(session) # attach-session is answered too
+    return client
+
+async def close_tmux_client(session: str):
+    client = _tmux_clients.pop(session, None)
+    _pane_snapshots.pop(session, None)
+    if client is not None:
+        client.stdin.close() # tmux -C detaches once its input ends
+        await client.wait()
+
+async def read_tmux_reply(session: str) -> bytes:
+    # replies are framed by %begin/%end (or %error) lines sharing a guard;
+    # notifications arrive outside the frames, and only %output matters.
+    # nothing is decoded: panes are hashed and searched as bytes
+    guard = None
+    reply = []
+    stdout = _tmux_clients[session].stdout
+    while line := await stdout.readline():
+        if guard is None:
+            if line.startswith(b"%begin "):
+                guard = line[len(b"%begin "):]
+            elif line.startswith(b"%output "):
+                _pane_snapshots.pop(session, None)
+        elif line == b"%end " + guard:
+            return b"".join(reply)
+        elif line == b"%error " + guard:
+            message = b"".join(reply).decode(errors="replace")
+            raise TmuxError(message.strip())
+        else:
+            reply.append(line)
+    raise EOFError("tmux control client exited")
+
+async def tmux_pipeline(session: str, *commands: bytes) -> list:
+    # each command is a complete, encoded line (see pane_commands). they go
+    # out in one write and their replies come back in order, so several
+    # commands cost a single round trip
+    client = await get_tmux_client(session)
+    client.stdin.write(b"".join(commands))
+    await client.stdin.drain()
+    return [await read_tmux_reply(session) for _ in commands]
+
+async def tmux_command(session: str, command: bytes) -> bytes:
+    (reply,) = await tmux_pipeline(session, command)
+    return reply
+
+async def wait_for_pane(session: str, timeout: float):
+    # the control client already streams pane output as %output lines, so
+    # rather than sleeping blind: return once the pane printed something
+    # and then settled for MIN_POLL_INTERVAL, or after `timeout` of
+    # silence. a pane that never settles still returns within
+    # MAX_POLL_INTERVAL
+    stdout = _tmux_clients[session].stdout
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    wake_at = start + timeout
+    while (remaining := wake_at - loop.time()) > 0:
+        try:
+            line = await asyncio.wait_for(stdout.readline(), remaining)
+        except asyncio.TimeoutError:
+            break
+        if not line:
+            raise EOFError("tmux control client exited")
+        if line.startswith(b"%output "):
+            _pane_snapshots.pop(session, None)
+            wake_at = min(loop.time() + MIN_POLL_INTERVAL,
+                          start + MAX_POLL_INTERVAL)
+
+@functools.lru_cache(maxsize=None)
+def send_keys_command(session: str, *keys: str) -> bytes:
+    # several keys go out in one send-keys, e.g. text followed by C-m
+    args = " ".join(map(shlex.quote, (session, *keys)))
+    return f"send-keys -t {args}\n".encode()
+
+async def send_tmux_keys(session: str, *keys: str):
+    await tmux_command(session, send_keys_command(session, *keys))
+
+@functools.lru_cache(maxsize=None)
+def pane_commands(session: str) -> tuple:
+    # the per-poll probe and capture, built and encoded once per session.
+    # the capture is the visible pane only (no -S/-E; "-S -" drags in all
+    # history) with -J, so rows that wrapped come back as one line: on a
+    # narrow pane the approval prompt would otherwise be split and never
+    # match APPROVAL_MSG
+    target = shlex.quote(session)
+    probe = f"display -p -t {target} '#{{history_size}},#{{cursor_y}}'\n"
+    capture = f"capture-pane -pJ -t {target}\n"
+    return probe.encode(), capture.encode()
+
+async def get_tmux_content(session: str) -> tuple:
+    # probe with a one-line display first; only re-capture the pane when
+    # the probe moved or the pane printed something since the last capture.
+    # returns (content, digest) so callers compare 8 bytes, not whole panes
+    probe_cmd, capture_cmd = pane_commands(session)
+    if session in _pane_snapshots:
+        probe = await tmux_command(session, probe_cmd)
+        snapshot = _pane_snapshots.get(session)
+        if snapshot is not None and snapshot[0] == probe:
+            return snapshot[1:]
+        content = await tmux_command(session, capture_cmd)
+    else:
+        # the pane printed since the last capture, so one is due anyway:
+        # send it together with the probe and share the round trip
+        probe, content = await tmux_pipeline(session, probe_cmd, capture_cmd)
+    digest = hashlib.blake2b(content, digest_size=8).digest()
+    _pane_snapshots[session] = (probe, content, digest)
+    return content, digest
+
+async def send_approval(session: str):
+    await send_tmux_keys(session, "Down", "C-m")
+
+async def send_input(session: str):
+    await send_tmux_keys(session, INPUT_PROMPT, "C-m")
+
+def pane_tail(content: bytes, rows: int) -> bytes:
+    # the last `rows` rows above any blank ones, walked back from the end
+    # with rfind so the cost follows the tail rather than the whole pane
+    start = end = len(content.rstrip())
+    for _ in range(rows):
+        start = content.rfind(b"\n", 0, start)
+        if start < 0:
+            break
+    return content[start + 1:end]
 
-def needs_input(p1: str, p2: str) -> bool:
-    return p1 == p2
+def needs_approval(p1: tuple, p2: tuple) -> bool:
+    (_, h1), (content, h2) = p1, p2
+    if h1 != h2:
+        return False
+    # scan each distinct pane once, however many polls it sits there for
+    if h2 not in _approval_scans:
+        if len(_approval_scans) >= 256:
+            _approval_scans.clear()
+        # the prompt is drawn at the bottom, above any blank rows, so
+        # only the last few rows need searching
+        tail = pane_tail(content, APPROVAL_ROWS)
+        _approval_scans[h2] = APPROVAL_MSG_B in tail
+    return _approval_scans[h2]
+
+def needs_input(p1: tuple, p2: tuple) -> bool:
+    return p1[1] == p2[1]
 
 def is_finished(workdir: str) -> bool:
     return not os.path.exists(
         os.path.join(workdir, "INCOMPLETE.md")
     )
+
+def watch_finish_flag(workdir: str):
+    # returns a check for is_finished(workdir). with inotify it drains
+    # pending events instead of stat()ing the file on every poll
+    if INotify is None:
+        return lambda: is_finished(workdir)
+    inotify = INotify()
+    gone = flags.DELETE | flags.MOVED_FROM
+    inotify.add_watch(workdir, gone | flags.CREATE | flags.MOVED_TO)
+    finished = is_finished(workdir)
+    def check() -> bool:
+        nonlocal finished
+        for event in inotify.read(timeout=0):
+            if event.name == "INCOMPLETE.md":
+                finished = bool(event.mask & gone)
+        return finished
+    return check
     
-def manage_claude(session: str, workdir: str,
-                  autoapprove=True,
-                  autocontinue=False,
-                  check_finished=False):
-    p1 = p2 = ""
-    while True: # ~ SOTA technology ~
-        p1 = get_tmux_content(session)
-        time.sleep(2)
-        p2 = get_tmux_content(session)
-
-        if check_finished and is_finished(workdir):
-            print("finished!")
-            break
-        if autoapprove and needs_approval(p1, p2):
-            send_approval(session)
-            print("sent approval")
-            continue
-        if autocontinue and needs_input(p1, p2):
-            send_input(session)
-            print("sent input")
-            continue
-
-def tmux_session_exists(session: str):
+async def manage_claude(session: str, workdir: str,
+                        autoapprove=True,
+                        autocontinue=False,
+                        check_finished=False):
+    interval = MIN_POLL_INTERVAL
+    idle = 0.0 # seconds the pane has stayed the same
+    acted = None # digest of the pane we last sent keys to
+    finished = watch_finish_flag(workdir) if check_finished else None
     try:
-        subprocess.check_output(
-                ['tmux', 'has-session', '-t', session], 
-                stderr=subprocess.DEVNULL
-        )
-        return True
-    except subprocess.CalledProcessError:
-        return False
+        p2 = await get_tmux_content(session)
+        while True: # ~ SOTA technology ~
+            # compare against the previous poll's capture rather than
+            # capturing twice per cycle
+            p1 = p2
+            await wait_for_pane(session, interval)
+            p2 = await get_tmux_content(session)
+
+            # poll fast while things move, back off while they don't
+            if p1[1] == p2[1]:
+                idle += interval
+                interval = min(interval * 1.5, MAX_POLL_INTERVAL)
+            else:
+                idle, interval = 0.0, MIN_POLL_INTERVAL
+
+            if check_finished and finished():
+                print("finished!")
+                break
+            # claude may take longer than a short poll to redraw after our
+            # keys, so don't answer the same screen twice: wait for it to
+            # change first, or the extra keys land on whatever comes next
+            if p2[1] == acted:
+                continue
+            acted = None
+            if autoapprove and needs_approval(p1, p2):
+                await send_approval(session)
+                print("sent approval")
+                acted = p2[1]
+                idle, interval = 0.0, MIN_POLL_INTERVAL
+                # p2 predates the keys, so don't carry it into the next poll
+                p2 = await get_tmux_content(session)
+                continue
+            # a short pause can just be claude between steps, so only
+            # nudge it after the pane sat still as long as a full poll
+            if (autocontinue and idle >= MAX_POLL_INTERVAL
+                    and needs_input(p1, p2)):
+                await send_input(session)
+                print("sent input")
+                acted = p2[1]
+                idle, interval = 0.0, MIN_POLL_INTERVAL
+                p2 = await get_tmux_content(session)
+                continue
+    except (EOFError, ConnectionError, TmuxError):
+        print(f"tmux session '{session}' is gone")
+    finally:
+        await close_tmux_client(session)
+
+async def run_claude(session: str, workdir: str, **options):
+    # attaching the control client doubles as the has-session check, so
+    # claude is only spawned when the attach finds no session
+    try:
+        await get_tmux_client(session)
+    except TmuxError:
+        await close_tmux_client(session)
+        spawn_claude(session, workdir)
+    await manage_claude(session, workdir, **options)
 
 def spawn_claude(session: str, workdir: str):
     print(f"spawning claude in tmux session '{session}'...")
+    cmd = ("tmux", "new-session", "-d",
+           "-s", session, "-c", workdir, "claude")
     try:
-        cmd = ["tmux", "new-session", "-d",
-               "-s", session, "-c", workdir, "claude"]
-        subprocess.run(cmd)
-        if not tmux_session_exists(session):
-            raise Exception
-    except Exception:
+        returncode = subprocess.run(cmd, close_fds=False).returncode
+    except OSError: # tmux itself is missing
+        returncode = None
+    if returncode != 0:
         print(f"error making tmux for claude... make sure they're on path")
         exit(1)
     print(f"claude is clauding...\n")
@@ -158,9 +312,21 @@ def ask_and_save_user_instructions_to(path_to_save_to: str):
         print('claude needs something to do! exiting...')
         exit(1)
     
-    with open(path_to_save_to, 'w') as dst:
-        dst.write(instructions_content)
-        print(f'saved instructions to {path_to_save_to}')
+    Path(path_to_save_to).write_text(instructions_content)
+    print(f'saved instructions to {path_to_save_to}')
+
+def _write_if_absent(path: str, data: str) -> bool:
+    # a single O_EXCL open rather than exists() then open(), with no race
+    # in between. returns whether the file was created
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    except FileExistsError:
+        return False
+    try:
+        os.write(fd, data.encode())
+    finally:
+        os.close(fd)
+    return True
 
 def ensure_workdir(workdir: str):
     if not os.path.exists(workdir):
@@ -169,9 +335,7 @@ def ensure_workdir(workdir: str):
 
 def ensure_claude_md(workdir: str):
     path = get_claude_md_path(workdir)
-    if not os.path.exists(path):
-        with open(path, 'w') as dst:
-            dst.write(CLAUDE_MD)
+    if _write_if_absent(path, CLAUDE_MD):
         print(f'created {path}')
 
 def ensure_instructions(workdir: str):
@@ -181,9 +345,7 @@ def ensure_instructions(workdir: str):
 
 def ensure_finish_flag(workdir: str):
     path = get_finish_flag_path(workdir)
-    if not os.path.exists(path):
-        with open(path, 'w') as dst:
-            dst.write(INCOMPLETE_MD)
+    if _write_if_absent(path, INCOMPLETE_MD):
         print(f'created {path}')
 
 def run(session=None,
@@ -213,24 +375,18 @@ def run(session=None,
     ensure_instructions(workdir)
     ensure_finish_flag(workdir) if check_finished else ...
 
-    # spawn claude in a session if needed
-    if not tmux_session_exists(session):
-        spawn_claude(session, workdir)
-    
-    # do the thing
-    manage_claude(session, workdir,
-                  autoapprove=autoapprove,
-                  autocontinue=autocontinue,
-                  check_finished=check_finished)
+    # spawn claude in a session if needed and do the thing
+    asyncio.run(run_claude(session, workdir,
+                           autoapprove=autoapprove,
+                           autocontinue=autocontinue,
+                           check_finished=check_finished))
 
 def init(workdir: str, check_finished=True):
     ensure_workdir(workdir)
     ensure_claude_md(workdir)
     ensure_finish_flag(workdir) if check_finished else ...
     instruction_path = get_instructions_path(workdir)
-    if not os.path.exists(instruction_path):
-        with open(instruction_path, 'w') as dst:
-            dst.write("put your instructions here")
+    _write_if_absent(instruction_path, "put your instructions here")
 
     print(f'set up a new vibecoder project: {workdir}')
     print(f'fill in {instruction_path}', end=' ')